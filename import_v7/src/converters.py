@@ -1,10 +1,14 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple, Dict, Any, Union, Literal
 import supervisely as sly
 from supervisely.geometry.graph import KeypointsTemplate
 import numpy as np
 import cv2
 
+# * Number of threads for requests which can't be batched (e.g. video annotations).
+UPLOAD_WORKERS = 8
+
 
 def get_entities_paths(dataset_path: str) -> List[str]:
     """Returns list of paths to entities in "images" directory of dataset in
@@ -16,16 +20,14 @@ def get_entities_paths(dataset_path: str) -> List[str]:
     :rtype: List[str]
     """
     sly.logger.info(f"Looking for entities in {dataset_path}")
-    images_directory = os.path.join(dataset_path, "images")
+    images_directory = os.path.abspath(os.path.join(dataset_path, "images"))
     if not os.path.isdir(images_directory):
         return []
 
-    entities_paths = [
-        os.path.abspath(os.path.join(images_directory, entity_file))
-        for entity_file in sly.fs.list_files(images_directory)
-    ]
+    # list_files() returns paths joined with the directory, so they are already absolute.
+    entities_paths = sly.fs.list_files(images_directory)
     sly.logger.info(f"Found {len(entities_paths)} entities.")
-    sly.logger.debug(f"Entities paths: {entities_paths}")
+    sly.logger.debug("Entities paths: %s", entities_paths)
     return entities_paths
 
 
@@ -60,7 +62,7 @@ def get_release_path(dataset_path: str) -> str:
     latest_release_path = releases[0]
     sly.logger.info(f"Found {len(releases)} releases, will use the latest one.")
     sly.logger.info(f"Latest release path: {latest_release_path}")
-    sly.logger.debug(f"Releases: {releases}. Latest release: {latest_release_path}")
+    sly.logger.debug("Releases: %s. Latest release: %s", releases, latest_release_path)
     return latest_release_path
 
 
@@ -76,14 +78,15 @@ def get_ann_paths(entities_paths: List[str]) -> List[str]:
     dataset_path = os.path.dirname(os.path.dirname(entities_paths[0]))
     sly.logger.info(f"Looking for annotations in {dataset_path}")
     latest_release_path = get_release_path(dataset_path)
-    anns_directory = os.path.join(latest_release_path, "annotations")
-    ann_paths = []
-    for entity_path in entities_paths:
-        entity_name = sly.fs.get_file_name(entity_path)
-        ann_path = os.path.abspath(os.path.join(anns_directory, f"{entity_name}.json"))
-        ann_paths.append(ann_path)
+    # Release path is absolute, so the paths of annotations are built with plain
+    # concatenation instead of joining and normalizing every path.
+    anns_prefix = os.path.join(latest_release_path, "annotations") + os.sep
+    ann_paths = [
+        f"{anns_prefix}{sly.fs.get_file_name(entity_path)}.json"
+        for entity_path in entities_paths
+    ]
     sly.logger.info(f"Found {len(ann_paths)} annotations.")
-    sly.logger.debug(f"Annotations paths: {ann_paths}")
+    sly.logger.debug("Annotations paths: %s", ann_paths)
     return ann_paths
 
 
@@ -113,7 +116,7 @@ def split_entities(
         f"Splitting finished. Images: {len(image_entities)}, videos: {len(video_entities)}"
     )
     sly.logger.debug(
-        f"Image entities: {image_entities}, video entities: {video_entities}"
+        "Image entities: %s, video entities: %s", image_entities, video_entities
     )
     return image_entities, video_entities
 
@@ -134,13 +137,13 @@ def convert_bbox(
     """
     class_name = v7_label.get("name")
     bbox = v7_label.get("bounding_box")
-    sly.logger.debug(f"Converting bbox: {bbox} with class name: {class_name}")
+    sly.logger.debug("Converting bbox: %s with class name: %s", bbox, class_name)
 
     obj_class = sly.ObjClass(name=class_name, geometry_type=sly.Rectangle)
 
     height, width = bbox.get("h"), bbox.get("w")
     x, y = bbox.get("x"), bbox.get("y")
-    sly.logger.debug(f"height: {height}, width: {width}, x: {x}, y: {y}")
+    sly.logger.debug("height: %s, width: %s, x: %s, y: %s", height, width, x, y)
 
     bbox_coordinates = [height, width, x, y]
     if any([coord is None for coord in bbox_coordinates]):
@@ -179,7 +182,7 @@ def convert_polyline(
     """
     class_name = v7_label.get("name")
     line = v7_label.get("line")
-    sly.logger.debug(f"Converting polyline: {line} with class name: {class_name}")
+    sly.logger.debug("Converting polyline: %s with class name: %s", line, class_name)
 
     obj_class = sly.ObjClass(name=class_name, geometry_type=sly.Polyline)
 
@@ -216,7 +219,7 @@ def convert_polygon(
     """
     class_name = v7_label.get("name")
     polygon = v7_label.get("polygon")
-    sly.logger.debug(f"Converting polygon: {polygon} with class name: {class_name}")
+    sly.logger.debug("Converting polygon: %s with class name: %s", polygon, class_name)
 
     obj_class = sly.ObjClass(name=class_name, geometry_type=sly.Polygon)
 
@@ -254,7 +257,9 @@ def convert_point(
     """
     class_name = v7_label.get("name")
     keypoint = v7_label.get("keypoint")
-    sly.logger.debug(f"Converting keypoint: {keypoint} with class name: {class_name}")
+    sly.logger.debug(
+        "Converting keypoint: %s with class name: %s", keypoint, class_name
+    )
 
     obj_class = sly.ObjClass(name=class_name, geometry_type=sly.Point)
     row, col = keypoint.get("y"), keypoint.get("x")
@@ -338,7 +343,7 @@ def convert_bitmap(
     """
     default_name = v7_label.get("name")
     height, width = kwargs.get("height"), kwargs.get("width")
-    sly.logger.debug(f"Height: {height}, width: {width} for bitmap conversion")
+    sly.logger.debug("Height: %s, width: %s for bitmap conversion", height, width)
     raster_layer = v7_label.get("raster_layer")
 
     mask_annotation_ids_mapping = raster_layer.get("mask_annotation_ids_mapping")
@@ -394,25 +399,18 @@ def dense_rle_to_binary_mask(
         and value is binary mask
     :rtype: Dict[int, np.ndarray]
     """
-    values = set(rle[::2])
-    decoded_rle = {}
-    for value in values:
-        if value == 0:
-            continue
-        decoded_rle[value] = []
+    rle = np.asarray(rle)
+    values, counts = rle[::2], rle[1::2]
 
-    for rle_pair in zip(rle[::2], rle[1::2]):
-        value, count = rle_pair
-        for key in decoded_rle.keys():
-            if key == value:
-                decoded_rle[key].extend([1] * count)
-            else:
-                decoded_rle[key].extend([0] * count)
+    # Decoding the whole mask at once with numpy, instead of building
+    # python lists of pixels for every layer.
+    decoded_rle = np.repeat(values, counts).reshape((height, width))
 
     binary_masks = {}
-    for key, value in decoded_rle.items():
-        binary_mask = np.array(value).reshape((height, width))
-        binary_masks[key] = binary_mask
+    for value in np.unique(values):
+        if value == 0:
+            continue
+        binary_masks[int(value)] = decoded_rle == value
 
     return binary_masks
 
@@ -452,7 +450,7 @@ def v7_image_ann_to_sly(v7_ann: Dict[str, Any], image_path: str) -> sly.Annotati
 
     v7_labels = v7_ann.get("annotations", [])
     sly.logger.info(f"Found {len(v7_labels)} V7 labels in annotation.")
-    sly.logger.debug(f"V7 Labels dict: {v7_labels}")
+    sly.logger.debug("V7 Labels dict: %s", v7_labels)
 
     bitmap_names = get_bitmap_names(v7_labels)
 
@@ -508,14 +506,11 @@ def v7_video_ann_to_sly(v7_ann: Dict[str, Any], video_path: str) -> sly.Annotati
 
     v7_frames = v7_ann.get("annotations", [])
     sly.logger.info(f"Found {len(v7_frames)} V7 labels in annotation.")
-    sly.logger.debug(f"V7 Labels dict: {v7_frames}")
+    sly.logger.debug("V7 Labels dict: %s", v7_frames)
 
     v7_labels = []
     for v7_frame in v7_frames:
-        frame_indexes = list(v7_frame.get("frames").keys())
-        frames = v7_frame.get("frames")
-        for frame_idx in frame_indexes:
-            frame_label = v7_frame.get("frames").get(frame_idx)
+        for frame_idx, frame_label in v7_frame.get("frames").items():
             frame_label["frame_idx"] = int(frame_idx)
             frame_label["id"] = v7_frame.get("id")
             frame_label["name"] = v7_frame.get("name")
@@ -556,9 +551,9 @@ def v7_video_ann_to_sly(v7_ann: Dict[str, Any], video_path: str) -> sly.Annotati
                     video_objects.append(label_object)
 
     objects = sly.VideoObjectCollection(video_objects)
-    sly.logger.debug(f"Number of video objects: {len(video_objects)}")
+    sly.logger.debug("Number of video objects: %s", len(video_objects))
     frames = sly.FrameCollection(sly_frames)
-    sly.logger.debug(f"Number of frames: {len(sly_frames)}")
+    sly.logger.debug("Number of frames: %s", len(sly_frames))
 
     sly_ann = sly.VideoAnnotation(
         img_size=(video_height, video_width),
@@ -657,33 +652,37 @@ def process_image_entities(
         type=sly.ProjectType.IMAGES,
         change_name_if_conflict=True,
     )
-    sly.logger.debug(f"Created project {project_info.name} with ID {project_info.id}")
+    sly.logger.debug(
+        "Created project %s with ID %s", project_info.name, project_info.id
+    )
     dataset_info = api.dataset.create(
         project_info.id,
         "ds0",
         change_name_if_conflict=True,
     )
-    sly.logger.debug(f"Created dataset {dataset_info.name} with ID {dataset_info.id}")
+    sly.logger.debug(
+        "Created dataset %s with ID %s", dataset_info.name, dataset_info.id
+    )
 
     project_meta = sly.ProjectMeta.from_json(api.project.get_meta(project_info.id))
-    sly.logger.debug(f"Retrieved project meta: {project_meta}")
+    sly.logger.debug("Retrieved project meta: %s", project_meta)
 
+    # Collecting classes and tags by name and adding them to the meta at once,
+    # since every ProjectMeta.add_* call creates a new copy of the meta.
+    obj_classes, tag_metas = {}, {}
     sly_anns = []
     image_names = []
     image_paths = []
     for image_path, ann_path in image_entities:
         v7_ann = sly.json.load_json_file(ann_path)
-        # ! Debug code, remove it later
-        sly.json.dump_json_file(v7_ann, ann_path)
-        # ! End of debug code
         sly_ann = v7_image_ann_to_sly(v7_ann, image_path)
         for img_tag in sly_ann.img_tags:
-            if img_tag.meta not in project_meta.tag_metas:
-                project_meta = project_meta.add_tag_meta(img_tag.meta)
+            if img_tag.meta.name not in tag_metas:
+                tag_metas[img_tag.meta.name] = img_tag.meta
                 sly.logger.info(f"Added image tag {img_tag.meta.name} to project meta")
         for label in sly_ann.labels:
-            if label.obj_class not in project_meta.obj_classes:
-                project_meta = project_meta.add_obj_class(label.obj_class)
+            if label.obj_class.name not in obj_classes:
+                obj_classes[label.obj_class.name] = label.obj_class
                 sly.logger.info(
                     f"Added object class {label.obj_class.name} to project meta"
                 )
@@ -692,8 +691,9 @@ def process_image_entities(
         image_names.append(image_name)
         image_paths.append(image_path)
 
+    project_meta = update_project_meta(project_meta, obj_classes, tag_metas)
     api.project.update_meta(project_info.id, project_meta)
-    sly.logger.debug(f"Project {project_info.name} meta updated")
+    sly.logger.debug("Project %s meta updated", project_info.name)
 
     image_infos = api.image.upload_paths(dataset_info.id, image_names, image_paths)
     sly.logger.info(
@@ -724,26 +724,27 @@ def process_video_entities(
         type=sly.ProjectType.VIDEOS,
         change_name_if_conflict=True,
     )
-    sly.logger.debug(f"Created project {project_info.name} with ID {project_info.id}")
+    sly.logger.debug(
+        "Created project %s with ID %s", project_info.name, project_info.id
+    )
     dataset_info = api.dataset.create(
         project_info.id,
         "ds0",
         change_name_if_conflict=True,
     )
-    sly.logger.debug(f"Created dataset {dataset_info.name} with ID {dataset_info.id}")
+    sly.logger.debug(
+        "Created dataset %s with ID %s", dataset_info.name, dataset_info.id
+    )
 
     project_meta = sly.ProjectMeta.from_json(api.project.get_meta(project_info.id))
-    sly.logger.debug(f"Retrieved project meta: {project_meta}")
+    sly.logger.debug("Retrieved project meta: %s", project_meta)
 
+    obj_classes = {}
     sly_anns = []
     video_names = []
     video_paths = []
     for video_path, ann_path in video_entities:
         v7_ann = sly.json.load_json_file(ann_path)
-        v7_ann = sly.json.load_json_file(ann_path)
-        # ! Debug code, remove it later
-        sly.json.dump_json_file(v7_ann, ann_path)
-        # ! End of debug code
         sly_ann = v7_video_ann_to_sly(v7_ann, video_path)
         sly_anns.append(sly_ann)
         video_name = sly.fs.get_file_name_with_ext(video_path)
@@ -752,17 +753,22 @@ def process_video_entities(
 
         sly_ann: sly.VideoAnnotation
         for video_object in sly_ann.objects:
-            if video_object.obj_class not in project_meta.obj_classes:
-                project_meta = project_meta.add_obj_class(video_object.obj_class)
+            if video_object.obj_class.name not in obj_classes:
+                obj_classes[video_object.obj_class.name] = video_object.obj_class
                 sly.logger.info(
                     f"Added object class {video_object.obj_class.name} to project meta"
                 )
 
+    project_meta = update_project_meta(project_meta, obj_classes)
     api.project.update_meta(project_info.id, project_meta)
 
     video_infos = api.video.upload_paths(dataset_info.id, video_names, video_paths)
-    for video_info, sly_ann in zip(video_infos, sly_anns):
-        api.video.annotation.append(video_info.id, sly_ann)
+
+    # Annotations can be appended only for one video per request,
+    # so the requests are sent in parallel.
+    video_ids = [video_info.id for video_info in video_infos]
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        list(executor.map(api.video.annotation.append, video_ids, sly_anns))
 
     sly.logger.info(
         f"Uploaded {len(video_infos)} videos to project {project_info.name}"
@@ -772,6 +778,40 @@ def process_video_entities(
     return project_info
 
 
+def update_project_meta(
+    project_meta: sly.ProjectMeta,
+    obj_classes: Dict[str, sly.ObjClass],
+    tag_metas: Dict[str, sly.TagMeta] = None,
+) -> sly.ProjectMeta:
+    """Adds object classes and tag metas which are not in the project meta yet
+    with a single call for each collection.
+
+    :param project_meta: project meta to update
+    :type project_meta: sly.ProjectMeta
+    :param obj_classes: object classes to add, where key is class name
+    :type obj_classes: Dict[str, sly.ObjClass]
+    :param tag_metas: tag metas to add, where key is tag name, defaults to None
+    :type tag_metas: Dict[str, sly.TagMeta], optional
+    :return: updated project meta
+    :rtype: sly.ProjectMeta
+    """
+    new_obj_classes = [
+        obj_class
+        for name, obj_class in obj_classes.items()
+        if project_meta.get_obj_class(name) is None
+    ]
+    new_tag_metas = [
+        tag_meta
+        for name, tag_meta in (tag_metas or {}).items()
+        if project_meta.get_tag_meta(name) is None
+    ]
+    if new_obj_classes:
+        project_meta = project_meta.add_obj_classes(new_obj_classes)
+    if new_tag_metas:
+        project_meta = project_meta.add_tag_metas(new_tag_metas)
+    return project_meta
+
+
 CONVERT_MAP = {
     "bounding_box": convert_bbox,
     "line": convert_polyline,
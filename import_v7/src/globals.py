@@ -35,6 +35,18 @@ ARCHIVE_DIR = os.path.join(TEMP_DIR, "archives")
 
 # * Directory, where unpacked V7 datasets will be stored.
 UNPACKED_DIR = os.path.join(TEMP_DIR, "unpacked")
+
+# * Unpacking to tmpfs is disabled by default, since tmpfs pages are counted against
+# the memory limit of the container. Can be enabled with V7_UNPACK_TO_RAM=1.
+UNPACK_TO_RAM = os.getenv("V7_UNPACK_TO_RAM") == "1"
+
+# * RAM-backed (tmpfs) directory, where archives are unpacked if there is enough memory.
+# /dev/shm can be shared between apps on the same host, so the directory is unique per task.
+SHM_DIR = "/dev/shm"
+SHM_UNPACKED_DIR = os.path.join(
+    SHM_DIR, f"v7_unpacked_{sly.io.env.task_id(raise_not_found=False) or os.getpid()}"
+)
+
 sly.fs.mkdir(ARCHIVE_DIR, remove_content_if_exists=True)
 sly.fs.mkdir(UNPACKED_DIR, remove_content_if_exists=True)
 sly.logger.debug(
@@ -1,5 +1,7 @@
 import os
-from typing import List
+import shutil
+import zipfile
+from typing import List, Union
 import supervisely as sly
 
 import globals as g
@@ -13,58 +15,62 @@ RELEASES_DIR = "releases"
 @sly.handle_exceptions
 def main():
     sly.logger.debug("Starting main function...")
-    data_path = download_data()
+    try:
+        data_path = download_data()
 
-    project_name = f"From V7 {os.path.basename(data_path)}"
-    sly.logger.info(f"Will use project name: {project_name}")
+        project_name = f"From V7 {os.path.basename(data_path)}"
+        sly.logger.info(f"Will use project name: {project_name}")
 
-    images_projects = []
-    videos_projects = []
+        images_projects = []
+        videos_projects = []
 
-    sly.logger.info(f"Will process V7 directories in {data_path}...")
+        sly.logger.info(f"Will process V7 directories in {data_path}...")
 
-    for v7_directory in v7_directories(data_path):
-        sly.logger.info(f"Found V7 directory: {v7_directory}, will process it...")
-        try:
-            image_project_info, video_project_info = process_v7_dataset(
-                v7_directory, g.api, g.WORKSPACE_ID
-            )
-
-            if image_project_info:
-                sly.logger.info(
-                    f"Created images project {image_project_info.name}, ID: {image_project_info.id}"
+        for v7_directory in v7_directories(data_path):
+            sly.logger.info(f"Found V7 directory: {v7_directory}, will process it...")
+            try:
+                image_project_info, video_project_info = process_v7_dataset(
+                    v7_directory, g.api, g.WORKSPACE_ID
                 )
-                images_projects.append(image_project_info)
-            if video_project_info:
-                sly.logger.info(
-                    f"Created videos project {video_project_info.name}, ID: {video_project_info.id}"
+
+                if image_project_info:
+                    sly.logger.info(
+                        f"Created images project {image_project_info.name}, ID: {image_project_info.id}"
+                    )
+                    images_projects.append(image_project_info)
+                if video_project_info:
+                    sly.logger.info(
+                        f"Created videos project {video_project_info.name}, ID: {video_project_info.id}"
+                    )
+                    videos_projects.append(video_project_info)
+            except Exception as e:
+                sly.logger.warning(
+                    f"Error while processing V7 directory: {e}, "
+                    "please, check that you provided a valid V7 dataset."
                 )
-                videos_projects.append(video_project_info)
-        except Exception as e:
-            sly.logger.warning(
-                f"Error while processing V7 directory: {e}, "
-                "please, check that you provided a valid V7 dataset."
-            )
 
-    sly.logger.info(f"Finished processing V7 directories in {data_path}.")
+        sly.logger.info(f"Finished processing V7 directories in {data_path}.")
 
-    if images_projects:
-        images_project_names = [project.name for project in images_projects]
-        images_project_ids = [project.id for project in images_projects]
-        sly.logger.info(
-            f"Created following images projects: {images_project_names} with IDs: {images_project_ids}"
-        )
-    if videos_projects:
-        videos_project_names = [project.name for project in videos_projects]
-        videos_project_ids = [project.id for project in videos_projects]
-        sly.logger.info(
-            f"Created following videos projects: {videos_project_names} with IDs: {videos_project_ids}"
-        )
+        if images_projects:
+            images_project_names = [project.name for project in images_projects]
+            images_project_ids = [project.id for project in images_projects]
+            sly.logger.info(
+                f"Created following images projects: {images_project_names} with IDs: {images_project_ids}"
+            )
+        if videos_projects:
+            videos_project_names = [project.name for project in videos_projects]
+            videos_project_ids = [project.id for project in videos_projects]
+            sly.logger.info(
+                f"Created following videos projects: {videos_project_names} with IDs: {videos_project_ids}"
+            )
 
-    if not images_projects and not videos_projects:
-        sly.logger.warning(
-            "No projects were created. Please, check that you provided a valid V7 dataset."
-        )
+        if not images_projects and not videos_projects:
+            sly.logger.warning(
+                "No projects were created. Please, check that you provided a valid V7 dataset."
+            )
+    finally:
+        # Unpacked data in tmpfs is stored in RAM, so it's removed even if the app failed.
+        sly.fs.remove_dir(g.SHM_UNPACKED_DIR)
 
     sly.logger.info("App finished work.")
 
@@ -140,7 +146,7 @@ def _download_archive(remote_path: str) -> str:
     sly.logger.debug(f"Archive downloaded to {save_path}.")
 
     file_name = sly.fs.get_file_name(remote_path)
-    unpack_path = os.path.join(g.UNPACKED_DIR, file_name)
+    unpack_path = os.path.join(_get_unpack_dir(save_path), file_name)
     sly.logger.debug(f"Will unpack archive to {unpack_path}.")
     try:
         sly.fs.unpack_archive(save_path, unpack_path)
@@ -153,5 +159,88 @@ def _download_archive(remote_path: str) -> str:
     return unpack_path
 
 
+def _get_unpack_dir(archive_path: str) -> str:
+    """Returns the directory for unpacking the archive. Unpacking to tmpfs avoids
+    writing all the archive content to disk just to read it back for the upload.
+    The tmpfs directory is used only if it's enabled with g.UNPACK_TO_RAM and both
+    tmpfs and available memory have at least 2 times more space than the unpacked
+    content of the archive, otherwise g.UNPACKED_DIR will be used.
+
+    :param archive_path: local path to the archive
+    :type archive_path: str
+    :return: path to the directory for unpacking
+    :rtype: str
+    """
+    if not g.UNPACK_TO_RAM or not os.path.isdir(g.SHM_DIR):
+        return g.UNPACKED_DIR
+
+    unpacked_size = _get_unpacked_size(archive_path)
+    if unpacked_size is None:
+        sly.logger.debug("Can't get unpacked size of the archive, will unpack to disk.")
+        return g.UNPACKED_DIR
+
+    # Data in tmpfs is stored in RAM and counted against the memory limit, and the app
+    # itself needs memory for the conversion, so the space is checked with a margin.
+    available = min(shutil.disk_usage(g.SHM_DIR).free, _get_available_memory())
+    if available > unpacked_size * 2:
+        sly.logger.debug(f"Will use RAM-backed {g.SHM_UNPACKED_DIR} for unpacking.")
+        sly.fs.mkdir(g.SHM_UNPACKED_DIR, remove_content_if_exists=True)
+        return g.SHM_UNPACKED_DIR
+    return g.UNPACKED_DIR
+
+
+def _get_unpacked_size(archive_path: str) -> Union[int, None]:
+    """Returns the total size of the files in the archive after unpacking.
+    Only zip archives store the sizes in the index, for other archives returns None.
+
+    :param archive_path: local path to the archive
+    :type archive_path: str
+    :return: size of the unpacked files in bytes or None if it's unknown
+    :rtype: Union[int, None]
+    """
+    if not zipfile.is_zipfile(archive_path):
+        return
+    with zipfile.ZipFile(archive_path) as archive:
+        return sum(info.file_size for info in archive.infolist())
+
+
+def _get_available_memory() -> int:
+    """Returns the amount of memory available for the app in bytes. Takes into account
+    both the memory of the host and the memory limit of the container (cgroup v1 and v2).
+    If the memory can't be determined, returns 0.
+
+    :return: available memory in bytes
+    :rtype: int
+    """
+    candidates = []
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    candidates.append(int(line.split()[1]) * 1024)
+                    break
+    except (OSError, ValueError):
+        pass
+
+    cgroup_files = [
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        (
+            "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+            "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+        ),
+    ]
+    for limit_path, usage_path in cgroup_files:
+        try:
+            with open(limit_path) as limit_file, open(usage_path) as usage_file:
+                limit, usage = limit_file.read().strip(), usage_file.read().strip()
+            if limit != "max":
+                candidates.append(int(limit) - int(usage))
+            break
+        except (OSError, ValueError):
+            continue
+
+    return max(0, min(candidates)) if candidates else 0
+
+
 if __name__ == "__main__":
     main()
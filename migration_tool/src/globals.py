@@ -1,10 +1,13 @@
 import os
+import threading
 
 from collections import namedtuple
 import supervisely as sly
 
 from dotenv import load_dotenv
 
+from migration_tool.src.ledger import Ledger
+
 ABSOLUTE_PATH = os.path.dirname(os.path.abspath(__file__))
 PARENT_DIR = os.path.dirname(ABSOLUTE_PATH)
 sly.logger.debug(f"Absolute path: {ABSOLUTE_PATH}, parent dir: {PARENT_DIR}")
@@ -29,10 +32,32 @@ api = sly.Api.from_env()
 
 TEMP_DIR = os.path.join(PARENT_DIR, "temp")
 
-# * Directory, where downloaded V7 datasets will be stored.
-DOWNLOAD_DIR = os.path.join(TEMP_DIR, "download")
-sly.fs.mkdir(DOWNLOAD_DIR, remove_content_if_exists=True)
-sly.logger.debug(f"Download dir: {DOWNLOAD_DIR}")
+
+def positive_int_from_env(name: str, default: int) -> int:
+    """Reads positive integer from the environment variable. If the variable is not set
+    or its value is not a positive integer, returns the default value.
+
+    :param name: name of the environment variable
+    :type name: str
+    :param default: value to use if the variable is not set or invalid
+    :type default: int
+    :return: value from the environment variable or the default value
+    :rtype: int
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value < 1:
+        sly.logger.warning(
+            f"{name} must be a positive integer, got {os.getenv(name)!r}. "
+            f"Will use the default value: {default}."
+        )
+        return default
+    return value
 
 
 class State:
@@ -48,10 +73,28 @@ class State:
 
         self.datasets = {}
 
+        # Maximum number of datasets downloading from V7 at the same time.
+        # Unbounded parallelism leads to rate limiting by V7 API.
+        # Can be overridden with the V7_MAX_CONCURRENT_DOWNLOADS environment variable
+        # or in the .env file from Team Files.
+        self.max_concurrent_downloads = positive_int_from_env(
+            "V7_MAX_CONCURRENT_DOWNLOADS", 5
+        )
+
+        # Number of threads downloading files of one dataset from V7.
+        self.max_file_downloads = 8
+
+        # Maximum number of downloaded datasets waiting for conversion and upload.
+        self.max_pending_datasets = 2
+
         # Will be set to False if the cancel button will be pressed.
         # Sets to True on every click on the "Copy" button.
         self.continue_copying = True
 
+        # Will be set when the stop button is pressed, wakes up threads waiting before retry.
+        # Clears on every click on the "Copy" button.
+        self.cancel_event = threading.Event()
+
     def clear_v7_credentials(self):
         """Clears the V7 credentials and sets them to None."""
 
@@ -69,6 +112,9 @@ class State:
         load_dotenv(V7_ENV_FILE)
 
         self.v7_api_key = os.getenv("V7_API_KEY")
+        self.max_concurrent_downloads = positive_int_from_env(
+            "V7_MAX_CONCURRENT_DOWNLOADS", self.max_concurrent_downloads
+        )
         sly.logger.debug(
             "V7 credentials readed successfully. Will check the connection."
         )
@@ -89,9 +135,35 @@ sly.logger.debug(f"Path to the local v7.env file: {V7_ENV_FILE}")
 V7_ENV_TEAMFILES = sly.env.file(raise_not_found=False)
 sly.logger.debug(f"Path to the TeamFiles from environment: {V7_ENV_TEAMFILES}")
 
-CopyingStatus = namedtuple("CopyingStatus", ["copied", "error", "waiting", "working"])
-COPYING_STATUS = CopyingStatus("✅ Copied", "❌ Error", "⏳ Waiting", "🔄 Working")
+CopyingStatus = namedtuple(
+    "CopyingStatus", ["copied", "error", "waiting", "working", "skipped"]
+)
+COPYING_STATUS = CopyingStatus(
+    "✅ Copied", "❌ Error", "⏳ Waiting", "🔄 Working", "⏭️ Copied before"
+)
 
 if V7_ENV_TEAMFILES:
     sly.logger.debug(".env file is provided, will try to download it.")
     STATE.load_from_env()
+
+# ! Settings below are read after the .env file from Team Files is loaded,
+# so they can be set in the same file as the V7 credentials.
+
+# * If V7_KEEP_CACHE=1 is set, downloaded V7 datasets are not removed, so they can be
+# reused without downloading them again on the next launches.
+KEEP_CACHE = os.getenv("V7_KEEP_CACHE") == "1"
+sly.logger.debug("Keep downloaded datasets: %s", KEEP_CACHE)
+
+# * Directory, where downloaded V7 datasets will be stored.
+DOWNLOAD_DIR = os.path.join(TEMP_DIR, "download")
+sly.fs.mkdir(DOWNLOAD_DIR, remove_content_if_exists=not KEEP_CACHE)
+sly.logger.debug(f"Download dir: {DOWNLOAD_DIR}")
+
+# * Progress of copying datasets, it's stored outside of the download dir,
+# since the download dir is cleaned on every launch (unless KEEP_CACHE is set).
+LEDGER = Ledger(os.path.join(TEMP_DIR, "progress.json"))
+
+# * If V7_RESET_PROGRESS=1 is set, saved progress is removed and already copied datasets
+# will be copied again.
+if os.getenv("V7_RESET_PROGRESS") == "1":
+    LEDGER.clear()
@@ -0,0 +1,51 @@
+import os
+from typing import Any, Dict
+
+import supervisely as sly
+
+
+class Ledger:
+    """Stores the progress of copying datasets in the JSON file, so after the
+    interruption copying can be resumed without downloading and uploading
+    already copied datasets again."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._state = {}
+
+        if os.path.isfile(path):
+            try:
+                self._state = sly.json.load_json_file(path)
+                sly.logger.debug("Loaded progress of %s datasets.", len(self._state))
+            except Exception as e:
+                sly.logger.warning(f"Can not read progress file {path}: {e}")
+
+    def get(self, key: str) -> Dict[str, Any]:
+        """Returns saved progress of the dataset or empty dict if it's unknown.
+
+        :param key: key of the dataset, includes team, workspace and dataset ID in V7
+        :type key: str
+        :return: saved progress of the dataset
+        :rtype: Dict[str, Any]
+        """
+        return self._state.get(key, {})
+
+    def mark(self, key: str, **kwargs) -> None:
+        """Updates progress of the dataset with given kwargs and saves it to the file.
+        The file is written to the temporary path first and then replaced atomically,
+        so it's never left partially written.
+
+        :param key: key of the dataset, includes team, workspace and dataset ID in V7
+        :type key: str
+        """
+        self._state.setdefault(key, {}).update(kwargs)
+
+        temp_path = f"{self.path}.tmp"
+        sly.json.dump_json_file(self._state, temp_path)
+        os.replace(temp_path, self.path)
+
+    def clear(self) -> None:
+        """Removes the progress of all datasets and the progress file."""
+        self._state = {}
+        sly.fs.silent_remove(self.path)
+        sly.logger.info("Progress of copying datasets was reset.")
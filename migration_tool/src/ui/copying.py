@@ -1,7 +1,11 @@
+import queue
+import random
+from collections import defaultdict
 import supervisely as sly
 from typing import Union
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
 from darwin.dataset.remote_dataset_v2 import RemoteDatasetV2
+from supervisely.app import DataJson
 from supervisely.app.widgets import (
     Container,
     Card,
@@ -12,10 +16,10 @@ from supervisely.app.widgets import (
     Flexbox,
 )
 from migration_tool.src.v7_api import (
-    get_datasets,
     get_dataset_url,
     retreive_dataset,
     get_export_path,
+    is_downloaded,
 )
 from import_v7.src.converters import process_v7_dataset
 import migration_tool.src.globals as g
@@ -30,6 +34,18 @@ COLUMNS = [
     "SUPERVISELY URL",
 ]
 
+# * Number of attempts to download the dataset again after the failed one.
+DOWNLOAD_RETRIES = 10
+
+# * Column indexes are static, so there is no need to search them in the table on every lookup.
+COLUMN_INDEXES = {column_name: idx for idx, column_name in enumerate(COLUMNS)}
+
+# * Maps V7 dataset ID to the index of its row in the table, filled in build_datasets_table().
+row_indexes = {}
+
+# * Links to Supervisely projects of each V7 dataset, rendered to the URL cell on update.
+project_links = defaultdict(list)
+
 datasets_table = Table(fixed_cols=3, per_page=20, sort_column_id=1)
 datasets_table.hide()
 
@@ -65,23 +81,27 @@ def build_datasets_table() -> None:
     sly.logger.debug("Building datasets table...")
     datasets_table.loading = True
     rows = []
+    row_indexes.clear()
+    project_links.clear()
+
+    # Datasets were already received from V7 API while filling the transfer widget,
+    # so there is no need to request the list of all datasets again.
+    for dataset_id in g.STATE.selected_datasets:
+        dataset: RemoteDatasetV2 = g.STATE.datasets[dataset_id]
+        dataset_url = get_dataset_url(dataset_id)
+        row_indexes[dataset_id] = len(rows)
+        rows.append(
+            [
+                g.COPYING_STATUS.waiting,
+                dataset_id,
+                dataset.name,
+                dataset.item_count,
+                f'<a href="{dataset_url}" target="_blank">{dataset_url}</a>',
+                "",
+            ]
+        )
 
-    for dataset in get_datasets():
-        dataset: RemoteDatasetV2
-        if dataset.dataset_id in g.STATE.selected_datasets:
-            dataset_url = get_dataset_url(dataset.dataset_id)
-            rows.append(
-                [
-                    g.COPYING_STATUS.waiting,
-                    dataset.dataset_id,
-                    dataset.name,
-                    dataset.item_count,
-                    f'<a href="{dataset_url}" target="_blank">{dataset_url}</a>',
-                    "",
-                ]
-            )
-
-    sly.logger.debug(f"Prepared {len(rows)} rows for the projects table.")
+    sly.logger.debug("Prepared %s rows for the projects table.", len(rows))
 
     datasets_table.read_json(
         {
@@ -100,8 +120,8 @@ def build_datasets_table() -> None:
 def start_copying() -> None:
     """Main function for copying projects from V7 to Supervisely.
     1. Starts copying progress, changes state of widgets in UI.
-    2. Iterates over selected projects from V7.
-    3. For each project:
+    2. Starts downloading of selected projects from V7 in background threads.
+    3. For each project (in order of finished downloads):
         3.1. Updates the status in the projects table to "Copying...".
         3.2. Iterates over tasks in the project.
         3.3. For each task:
@@ -118,94 +138,196 @@ def start_copying() -> None:
     8. Stops the application (if not in development mode).
     """
     sly.logger.debug(
-        f"Copying button is clicked. Selected datasets: {g.STATE.selected_datasets}"
+        "Copying button is clicked. Selected datasets: %s", g.STATE.selected_datasets
     )
 
     stop_button.show()
     copy_button.text = "Copying..."
     g.STATE.continue_copying = True
+    g.STATE.cancel_event.clear()
 
-    def save_dataset(dataset: RemoteDatasetV2, retry: int = 0) -> Union[None, str]:
-        sly.logger.info("Trying to retreive dataset data from V7 API...")
+    def save_dataset(dataset: RemoteDatasetV2) -> Union[None, str]:
+        # Export path is computed once and passed to the functions which need it.
         export_path = get_export_path(dataset)
         sly.logger.info(f"Export path for dataset {dataset.name}: {export_path}")
-        download_status = retreive_dataset(dataset)
-        if not download_status:
+        if is_downloaded(dataset, export_path):
+            sly.logger.info(f"Dataset {dataset.name} was already downloaded.")
+            return export_path
+
+        for retry in range(DOWNLOAD_RETRIES + 1):
+            sly.logger.info("Trying to retreive dataset data from V7 API...")
+            if retreive_dataset(dataset, export_path):
+                sly.logger.debug("Dataset %s was downloaded.", dataset.name)
+                return export_path
+
             sly.logger.info(
                 f"Can not download dataset data from V7 API for dataset {dataset.name}"
             )
-            if retry < 10:
-                # Try to download the task data again.
-                retry += 1
-                timer = 5
-                while timer > 0:
-                    sly.logger.info(f"Retry {retry} in {timer} seconds...")
-                    sleep(1)
-                    timer -= 1
-
-                sly.logger.info(f"Retry {retry} to download dataset {dataset.name}...")
-                return save_dataset(dataset, retry)
-            else:
-                # If the archive is empty after 10 retries, return False.
-                sly.logger.warning(
-                    f"Can't download dataset {dataset.name} after 10 retries."
-                )
+            if retry == DOWNLOAD_RETRIES:
+                break
+
+            # Jitter spreads retries of concurrent downloads, so they don't hit V7 API at once.
+            timer = min(60, 0.5 * 2**retry) * random.uniform(0.5, 1.5)
+            sly.logger.info(f"Retry {retry + 1} in {timer:.1f} seconds...")
+            if g.STATE.cancel_event.wait(timeout=timer):
+                # The stop button was pressed while waiting, no need to retry.
+                sly.logger.info(f"Retries of dataset {dataset.name} are cancelled.")
                 return
-        else:
-            sly.logger.debug(f"Dataset {dataset.name} was downloaded.")
-            return export_path
+
+        sly.logger.warning(
+            f"Can't download dataset {dataset.name} after {DOWNLOAD_RETRIES} retries."
+        )
 
     succesfully_uploaded = 0
     uploded_with_errors = 0
+    # Datasets which were copied to the same workspace on previous launches.
+    skipped = 0
 
-    with copying_progress(
-        total=len(g.STATE.selected_datasets), message="Copying..."
-    ) as pbar:
-        for dataset_id in g.STATE.selected_datasets:
-            if not g.STATE.continue_copying:
-                sly.logger.debug("Copying is stopped by the user.")
-                break
-
-            dataset = g.STATE.datasets[dataset_id]
-            sly.logger.debug(
-                f"Copying project with id: {dataset_id} and name: {dataset.name}"
-            )
-            update_cells(dataset_id, new_status=g.COPYING_STATUS.working)
+    # Downloaded datasets which are waiting for conversion, the size of the queue is limited
+    # so downloads are paused while conversion is behind and the disk is not overfilled.
+    ready_datasets = queue.Queue(maxsize=g.STATE.max_pending_datasets)
 
+    def download_dataset(dataset_id: int) -> None:
+        dataset = g.STATE.datasets[dataset_id]
+        try:
             dataset_path = save_dataset(dataset)
-            if dataset_path is None:
-                sly.logger.warning(f"Can not download dataset {dataset.name}.")
-                pbar.update(1)
-                continue
-
-            image_project_info, video_project_info = process_v7_dataset(
-                dataset_path, g.api, g.STATE.selected_workspace
-            )
-
-            if image_project_info is not None or video_project_info is not None:
-                new_status = g.COPYING_STATUS.copied
-                succesfully_uploaded += 1
-                update_cells(dataset_id, new_status=new_status)
+        except Exception as e:
+            sly.logger.warning(f"Error while downloading dataset {dataset.name}: {e}")
+            dataset_path = None
+        ready_datasets.put((dataset_id, dataset_path))
+
+    # Downloads from V7 are independent and bound by the network, so they are running
+    # in background threads, while each downloaded dataset is converted and uploaded
+    # here as soon as it's ready. Table is updated only from this thread.
+    with ThreadPoolExecutor(
+        max_workers=g.STATE.max_concurrent_downloads
+    ) as executor, copying_progress(
+        total=len(g.STATE.selected_datasets), message="Copying..."
+    ) as pbar:
+        futures = []
+        # Datasets which are submitted for copying, but not finished yet.
+        unfinished = set()
+        try:
+            for dataset_id in g.STATE.selected_datasets:
+                dataset = g.STATE.datasets[dataset_id]
+                progress = g.LEDGER.get(get_ledger_key(dataset_id))
+                if progress.get("status") == "copied":
+                    sly.logger.info(
+                        f"Dataset {dataset.name} was already copied, will skip it."
+                    )
+                    skipped += 1
+                    # Links may be already shown if copying was started again, so they are set
+                    # from the saved progress instead of being appended.
+                    project_links.pop(dataset_id, None)
+                    update_cells(
+                        dataset_id,
+                        new_status=g.COPYING_STATUS.skipped,
+                        new_urls=progress.get("sly_urls", []),
+                    )
+                    pbar.update(1)
+                    continue
+
+                sly.logger.debug(
+                    "Copying project with id: %s and name: %s", dataset_id, dataset.name
+                )
+                unfinished.add(dataset_id)
+                update_cells(dataset_id, new_status=g.COPYING_STATUS.working)
+                g.LEDGER.mark(get_ledger_key(dataset_id), status="working")
+                futures.append(executor.submit(download_dataset, dataset_id))
+
+            for _ in range(len(futures)):
+                # The queue is polled, so the stop button is handled without waiting
+                # for the next dataset to be downloaded.
+                while g.STATE.continue_copying:
+                    try:
+                        dataset_id, dataset_path = ready_datasets.get(timeout=1)
+                        break
+                    except queue.Empty:
+                        pass
+                if not g.STATE.continue_copying:
+                    sly.logger.debug("Copying is stopped by the user.")
+                    break
+
+                dataset = g.STATE.datasets[dataset_id]
+                if dataset_path is None:
+                    sly.logger.warning(f"Can not download dataset {dataset.name}.")
+                    uploded_with_errors += 1
+                    update_cells(dataset_id, new_status=g.COPYING_STATUS.error)
+                    g.LEDGER.mark(get_ledger_key(dataset_id), status="error")
+                    unfinished.discard(dataset_id)
+                    pbar.update(1)
+                    continue
 
-            if image_project_info is not None:
                 try:
-                    new_url = sly.utils.abs_url(image_project_info.url)
-                except Exception:
-                    new_url = image_project_info.url
-                sly.logger.debug(f"New URL for images project: {new_url}")
-                update_cells(dataset_id, new_url=new_url)
-            if video_project_info is not None:
+                    image_project_info, video_project_info = process_v7_dataset(
+                        dataset_path, g.api, g.STATE.selected_workspace
+                    )
+                except Exception as e:
+                    sly.logger.warning(
+                        f"Error while processing dataset {dataset.name}: {e}"
+                    )
+                    image_project_info = video_project_info = None
+
+                if not sly.is_development() and not g.KEEP_CACHE:
+                    # * Downloaded dataset is not needed after the upload, so it's removed
+                    # right away to keep disk usage bound by datasets in progress.
+                    sly.fs.remove_dir(dataset_path)
+                    sly.logger.debug("Removed downloaded dataset from %s", dataset_path)
+
+                # All changes of the row are collected and sent to the table at once.
+                new_urls = [
+                    get_project_url(project_info)
+                    for project_info in (image_project_info, video_project_info)
+                    if project_info is not None
+                ]
+                sly.logger.debug("New URLs for dataset %s: %s", dataset.name, new_urls)
+
+                if not new_urls:
+                    sly.logger.warning(f"No projects were created for {dataset.name}.")
+                    uploded_with_errors += 1
+                    update_cells(dataset_id, new_status=g.COPYING_STATUS.error)
+                    g.LEDGER.mark(get_ledger_key(dataset_id), status="error")
+                else:
+                    succesfully_uploaded += 1
+                    update_cells(
+                        dataset_id,
+                        new_status=g.COPYING_STATUS.copied,
+                        new_urls=new_urls,
+                    )
+                    g.LEDGER.mark(
+                        get_ledger_key(dataset_id),
+                        status="copied",
+                        export_path=dataset_path,
+                        sly_urls=new_urls,
+                    )
+
+                unfinished.discard(dataset_id)
+                pbar.update(1)
+        finally:
+            # Workers may be waiting before retries or for the place in the queue,
+            # so they are woken up and cancelled even if the loop above has failed.
+            g.STATE.cancel_event.set()
+            for future in futures:
+                future.cancel()
+            # Downloads which were already started may wait for the place in the queue,
+            # so the queue is drained until all of them are finished.
+            while not all(future.done() for future in futures):
                 try:
-                    new_url = sly.utils.abs_url(video_project_info.url)
-                except Exception:
-                    new_url = video_project_info.url
-                sly.logger.debug(f"New URL for videos project: {new_url}")
-                update_cells(dataset_id, new_url=new_url)
+                    ready_datasets.get(timeout=1)
+                except queue.Empty:
+                    pass
 
-            pbar.update(1)
+            # Datasets which were not copied because of the stop are waiting again.
+            for dataset_id in unfinished:
+                update_cells(dataset_id, new_status=g.COPYING_STATUS.waiting)
+                g.LEDGER.mark(get_ledger_key(dataset_id), status="waiting")
 
-    if succesfully_uploaded:
+    if succesfully_uploaded or skipped:
         good_results.text = f"Succesfully uploaded {succesfully_uploaded} projects."
+        if skipped:
+            good_results.text += (
+                f" Skipped {skipped} projects, which were copied on previous launches."
+            )
         good_results.show()
     if uploded_with_errors:
         bad_results.text = f"Uploaded {uploded_with_errors} projects with errors."
@@ -224,74 +346,82 @@ def start_copying() -> None:
         )
         return
 
-    sly.fs.clean_dir(g.DOWNLOAD_DIR)
+    if g.KEEP_CACHE:
+        sly.logger.info(
+            f"Downloaded datasets are kept in {g.DOWNLOAD_DIR}, will stop the application."
+        )
+    else:
+        sly.fs.clean_dir(g.DOWNLOAD_DIR)
 
-    sly.logger.info(
-        f"Removed content from {g.DOWNLOAD_DIR}, will stop the application."
-    )
+        sly.logger.info(
+            f"Removed content from {g.DOWNLOAD_DIR}, will stop the application."
+        )
 
     from migration_tool.src.main import app
 
     app.stop()
 
 
+def get_project_url(project_info: sly.ProjectInfo) -> str:
+    """Returns absolute URL of the project in Supervisely if it's possible,
+    otherwise returns the URL as it is.
+
+    :param project_info: information about the project in Supervisely
+    :type project_info: sly.ProjectInfo
+    :return: URL of the project
+    :rtype: str
+    """
+    try:
+        return sly.utils.abs_url(project_info.url)
+    except Exception:
+        return project_info.url
+
+
+def get_ledger_key(dataset_id: int) -> str:
+    """Returns the key of the dataset in the progress ledger. The key includes selected
+    team and workspace, so the dataset copied to one workspace is copied again
+    when another workspace is selected.
+
+    :param dataset_id: dataset ID in V7
+    :type dataset_id: int
+    :return: key of the dataset in the progress ledger
+    :rtype: str
+    """
+    return f"{g.STATE.selected_team}/{g.STATE.selected_workspace}/{dataset_id}"
+
+
 def update_cells(project_id: int, **kwargs) -> None:
     """Updates cells in the projects table by project ID.
+    All passed changes of the row are sent to the frontend at once.
     Possible kwargs:
         - new_status: new status for the project
-        - new_url: new Supervisely URL for the project
+        - new_urls: list of new Supervisely URLs for the project
 
     :param project_id: project ID in CVAT for projects table to update
     :type project_id: int
     """
-    key_cell_value = project_id
-    key_column_name = "ID"
+    table_json_data = datasets_table.get_json_data()["table_data"]
+    # Table.update_cell_value() searches for the row on every call,
+    # while the row index is already known.
+    row = table_json_data["data"][row_indexes[project_id]]
+
     if kwargs.get("new_status"):
-        column_name = "COPYING STATUS"
-        new_value = kwargs["new_status"]
-    elif kwargs.get("new_url"):
-        column_name = "SUPERVISELY URL"
-        url = kwargs["new_url"]
+        row[COLUMN_INDEXES["COPYING STATUS"]] = kwargs["new_status"]
 
+    new_urls = kwargs.get("new_urls")
+    if new_urls:
         # When updating the cell with the URL we need to append the new URL to the old value
         # for cases when one CVAT project was converted to multiple Supervisely projects.
         # This usually happens when CVAT project contains both images and videos
         # while Supervisely supports one data type per project.
-        old_value = get_cell_value(project_id)
-        if old_value:
-            old_value += "<br>"
-        new_value = old_value + f"<a href='{url}' target='_blank'>{url}</a>"
-
-    datasets_table.update_cell_value(
-        key_column_name, key_cell_value, column_name, new_value
-    )
-
-
-def get_cell_value(
-    project_id: int, column: str = "SUPERVISELY URL"
-) -> Union[str, None]:
-    """Returns value of the cell in the projects table by project ID and column name.
-    By default returns value of the "SUPERVISELY URL" column.
-
-    :param project_id: project ID in CVAT to find the table row
-    :type project_id: int
-    :param column: name of the columnm where to get the value, defaults to "SUPERVISELY URL"
-    :type column: str, optional
-    :return: value of the cell in the projects table or None if not found
-    :rtype: Union[str, None]
-    """
-    table_json_data = datasets_table.get_json_data()["table_data"]
-
-    # Find column index by column name.
-    cell_column_idx = None
-    for column_idx, column_name in enumerate(table_json_data["columns"]):
-        if column_name == column:
-            cell_column_idx = column_idx
-            break
+        links = project_links[project_id]
+        links.extend(f"<a href='{url}' target='_blank'>{url}</a>" for url in new_urls)
+        row[COLUMN_INDEXES["SUPERVISELY URL"]] = "<br>".join(links)
 
-    for row_idx, row_content in enumerate(table_json_data["data"]):
-        if row_content[1] == project_id:
-            return row_content[cell_column_idx]
+    # DataJson sends only the difference with the previous state,
+    # so only the changed cells go to the frontend.
+    DataJson()[datasets_table.widget_id]["table_data"] = table_json_data
+    DataJson().send_changes()
 
 
 @stop_button.click
@@ -300,6 +430,7 @@ def stop_copying() -> None:
     sly.logger.debug("Stop button is clicked.")
 
     g.STATE.continue_copying = False
+    g.STATE.cancel_event.set()
     copy_button.text = "Stopping..."
 
     stop_button.hide()
@@ -1,10 +1,12 @@
+import threading
+
 import supervisely as sly
 
 from supervisely.app.widgets import Card, Text, Input, Field, Button, Container
 
 import migration_tool.src.globals as g
 import migration_tool.src.ui.selection as selection
-from migration_tool.src.v7_api import get_configurtation
+from migration_tool.src.v7_api import get_configurtation, clear_cache
 
 
 v7_api_key_input = Input(minlength=1, type="password", placeholder="for example: admin")
@@ -70,7 +72,8 @@ def disconnected(with_error=False) -> None:
     """
 
     sly.logger.debug(
-        f"Status changed to disconnected with error: {with_error}, will change widget states."
+        "Status changed to disconnected with error: %s, will change widget states.",
+        with_error,
     )
     v7_api_key_input.enable()
     connect_button.enable()
@@ -90,6 +93,7 @@ def disconnected(with_error=False) -> None:
         connection_status_text.text = "Disconnected from V7."
 
     g.STATE.clear_v7_credentials()
+    clear_cache()
     connection_status_text.show()
 
 
@@ -101,14 +105,13 @@ def change_connect_button_state(_: str) -> None:
     :param _: Unused (value from the widget)
     :type input_value: str
     """
-    if all(
-        [
-            v7_api_key_input.get_value(),
-        ]
-    ):
-        connect_button.enable()
+    # Enabling and disabling the button sends a message to the frontend,
+    # so it's skipped if the button is already in the required state.
+    if v7_api_key_input.get_value():
+        if connect_button.is_disabled():
+            connect_button.enable()
 
-    else:
+    elif not connect_button.is_disabled():
         connect_button.disable()
 
 
@@ -128,6 +131,30 @@ def try_to_connect() -> None:
         disconnected(with_error=True)
 
 
+def check_connection_from_env() -> None:
+    """Checks the connection to the V7 server with the credentials loaded from .env file
+    and changes the state of the widgets depending on the result."""
+    try:
+        connection_status = get_configurtation()
+
+        if connection_status:
+            sly.logger.info("Connection to V7 server was successful.")
+
+            connected()
+
+        else:
+            sly.logger.warning("Connection to V7 server failed.")
+
+            disconnected(with_error=True)
+    except Exception as e:
+        # The thread is not visible to the user, so any error is shown as failed connection.
+        sly.logger.warning(f"Connection to V7 server failed: {e}")
+
+        disconnected(with_error=True)
+    finally:
+        connect_button.loading = False
+
+
 if g.STATE.loaded_from_env:
     sly.logger.debug('The application was started with the "Load from .env" option.')
 
@@ -136,14 +163,7 @@ if g.STATE.loaded_from_env:
     v7_api_key_input.set_value(g.STATE.v7_api_key)
     connect_button.enable()
 
-    connection_status = get_configurtation()
-
-    if connection_status:
-        sly.logger.info("Connection to V7 server was successful.")
-
-        connected()
-
-    else:
-        sly.logger.warning("Connection to V7 server failed.")
-
-        disconnected(with_error=True)
+    # * Connection is checked in the background, so the UI is available
+    # without waiting for the response from V7 API.
+    connect_button.loading = True
+    threading.Thread(target=check_connection_from_env, daemon=True).start()
@@ -1,3 +1,4 @@
+from operator import attrgetter
 from typing import NamedTuple
 import supervisely as sly
 from supervisely.app.widgets import Card, Transfer, Button, Container
@@ -33,19 +34,19 @@ def fill_transfer_with_datasets() -> None:
     On every launch clears the items in the widget and fills it with new datasets."""
 
     sly.logger.debug("Starting to build transfer widget with datasets.")
-    transfer_items = []
-
-    for dataset in get_datasets():
-        g.STATE.datasets[dataset.dataset_id] = dataset
-        transfer_items.append(
-            Transfer.Item(
-                key=dataset.dataset_id, label=f"[{dataset.dataset_id}] {dataset.name}"
-            )
+    # Datasets are sorted before building the items, so items are created in order.
+    datasets = sorted(get_datasets(), key=attrgetter("dataset_id"))
+    g.STATE.datasets.update((dataset.dataset_id, dataset) for dataset in datasets)
+
+    transfer_items = [
+        Transfer.Item(
+            key=dataset.dataset_id, label=f"[{dataset.dataset_id}] {dataset.name}"
         )
+        for dataset in datasets
+    ]
 
-    sly.logger.debug(f"Prepared {len(transfer_items)} items for transfer.")
+    sly.logger.debug("Prepared %s items for transfer.", len(transfer_items))
 
-    transfer_items.sort(key=lambda item: item.key)
     datasets_transfer.set_items(transfer_items)
     sly.logger.debug("Transfer widget filled with datasets.")
 
@@ -72,7 +73,9 @@ def select_datasets() -> None:
     dataset_ids = datasets_transfer.get_transferred_items()
 
     sly.logger.debug(
-        f"Select datasets button clicked, selected dataset IDs: {dataset_ids}. Will save them to the global state."
+        "Select datasets button clicked, selected dataset IDs: %s. "
+        "Will save them to the global state.",
+        dataset_ids,
     )
     g.STATE.selected_datasets = dataset_ids
 
@@ -95,7 +98,7 @@ def change_selection() -> None:
         "And reset selected projects in the global state."
     )
 
-    g.STATE.datasets = dict()
+    # * Datasets from V7 are kept, since the transfer widget is not refilled.
     g.STATE.selected_projects = None
 
     card.unlock()
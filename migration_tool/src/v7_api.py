@@ -1,9 +1,15 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from darwin.client import Client
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Union, List
 import supervisely as sly
 from darwin.exceptions import InvalidLogin, NameTaken, NotFound
 from datetime import datetime
+from darwin.dataset.release import Release
 from darwin.dataset.remote_dataset_v2 import RemoteDatasetV2
 
 import migration_tool.src.globals as g
@@ -11,34 +17,82 @@ import migration_tool.src.globals as g
 
 DEFAULT_DATASET_ADDRESS = "https://darwin.v7labs.com/datasets"
 
+# * Retries of V7 API requests on connection errors and temporary server errors.
+# Only idempotent methods are retried, responses are returned to Darwin SDK as is
+# after the last attempt, so it can handle errors in its own way.
+V7_API_RETRY = Retry(
+    total=5,
+    backoff_factor=0.3,
+    status_forcelist=(502, 503, 504),
+    raise_on_status=False,
+)
+
+# * Time in seconds, while the list of datasets from V7 API is reused without
+# querying V7 again.
+DATASETS_CACHE_TTL = 60
+_datasets_cache = {}
+
+# * Name of exports created in V7, it's computed once per launch, so all datasets
+# are exported with the same name, even if copying continues after midnight.
+EXPORT_NAME = f"sly_export_{datetime.now().strftime('%Y-%m-%d')}"
+
+# * Number of attempts to get the release of the dataset, while V7 is preparing the export.
+RELEASE_ATTEMPTS = 6
+
+# * Marker file, which is written to the export path after the dataset was fully
+# downloaded, so the download can be skipped when the copying is started again.
+COMPLETE_MARKER = ".complete"
+
+
+@lru_cache(maxsize=1)
+def _get_client(api_key: str) -> Client:
+    # * Client keeps its own requests.Session with connection pool, so reusing it
+    # allows to avoid new login and TLS handshakes on every call to V7 API.
+    client = Client.from_api_key(api_key)
+    sly.logger.debug("Successfully logged in V7 API.")
+    client.session.mount(
+        "https://", HTTPAdapter(pool_maxsize=100, max_retries=V7_API_RETRY)
+    )
+    client.set_datasets_dir(g.DOWNLOAD_DIR)
+    sly.logger.debug(f"Datasets dir set to: {g.DOWNLOAD_DIR}")
+    return client
+
 
 def get_configurtation() -> Union[None, Client]:
     try:
-        client = Client.from_api_key(g.STATE.v7_api_key)
-        sly.logger.debug("Successfully logged in V7 API.")
-        client.set_datasets_dir(g.DOWNLOAD_DIR)
-        sly.logger.debug(f"Datasets dir set to: {g.DOWNLOAD_DIR}")
-        return client
+        return _get_client(g.STATE.v7_api_key)
     except InvalidLogin:
         sly.logger.error("Can not connect with provided API key.")
         return
 
 
 def get_datasets() -> List[RemoteDatasetV2]:
+    cached = _datasets_cache.get(g.STATE.v7_api_key)
+    if cached is not None and time.monotonic() - cached[0] < DATASETS_CACHE_TTL:
+        sly.logger.debug("Using cached list of datasets from V7 API.")
+        return cached[1]
+
     client = get_configurtation()
     if client is None:
         return
-    datasets = []
-    for dataset in client.list_remote_datasets():
-        datasets.append(dataset)
+    datasets = list(client.list_remote_datasets())
+    _datasets_cache[g.STATE.v7_api_key] = (time.monotonic(), datasets)
     return datasets
 
 
+def clear_cache() -> None:
+    """Removes cached V7 client and list of datasets, so the next call to V7 API
+    will login again and query actual data."""
+    _get_client.cache_clear()
+    _datasets_cache.clear()
+    sly.logger.debug("V7 API cache cleared.")
+
+
 def get_dataset_url(dataset_id: int) -> str:
     return f"{DEFAULT_DATASET_ADDRESS}/{dataset_id}/"
 
 
-def retreive_dataset(dataset: RemoteDatasetV2) -> bool:
+def retreive_dataset(dataset: RemoteDatasetV2, export_path: str) -> bool:
     export_name = get_export_name()
     sly.logger.info(f"Will try to export dataset {dataset.name} to {export_name}")
     try:
@@ -52,18 +106,36 @@ def retreive_dataset(dataset: RemoteDatasetV2) -> bool:
         sly.logger.info(f"Export {export_name} already exists")
     finally:
         try:
-            release = dataset.get_release()
+            release = wait_for_release(dataset)
             sly.logger.info("Release was retreived successfully.")
             sly.logger.info(f"Image count: {release.image_count}")
-            dataset.pull(release=release, multi_threaded=False, use_folders=True)
+            failed_files = pull_release(dataset, release)
 
-            export_path = get_export_path(dataset)
-            sly.logger.info(f"Export path of dataset {dataset.name}: {export_path}")
-            if not os.path.isdir(export_path):
-                sly.logger.info(f"Can't find downloaded dataset in {export_path}")
+            # Pull creates the directories before downloading any file, so the images
+            # directory is checked, since it's the one that is read by the converter.
+            images_path = os.path.join(export_path, "images")
+            if not is_not_empty_dir(images_path):
+                sly.logger.info(f"Can't find downloaded files in {images_path}")
                 return False
+
+            if failed_files:
+                # Partially downloaded dataset is treated as a failed attempt, pull on the
+                # next attempt downloads only missing files, since existing are not replaced.
+                sly.logger.warning(
+                    f"Dataset {dataset.name} was downloaded partially, "
+                    f"{failed_files} files are missing."
+                )
+                return False
+
+            sly.json.dump_json_file(
+                {
+                    "release": release.name,
+                    "downloaded_at": datetime.now().isoformat(),
+                },
+                os.path.join(export_path, COMPLETE_MARKER),
+            )
             return True
-        except NotFound:
+        except (NotFound, StopIteration):
             sly.logger.warning(f"Can't find any release for dataset {dataset.name}")
             return False
         except ValueError as e:
@@ -74,11 +146,131 @@ def retreive_dataset(dataset: RemoteDatasetV2) -> bool:
                 f"Error: {e}"
             )
             return False
+        except Exception as e:
+            # Any other error is treated as a failed attempt, so the download is retried.
+            sly.logger.warning(f"Can not download the dataset {dataset.name}: {e}")
+            return False
+
+
+def wait_for_release(dataset: RemoteDatasetV2) -> Release:
+    """Returns the latest release of the dataset. The export is created by V7 asynchronously,
+    so if the release is not available yet, it will be requested again with exponential backoff.
+
+    :param dataset: dataset from V7
+    :type dataset: RemoteDatasetV2
+    :raises NotFound: if the dataset has no releases after all attempts
+    :raises StopIteration: if no release is available yet after all attempts
+    :return: the latest release of the dataset
+    :rtype: Release
+    """
+    for attempt in range(RELEASE_ATTEMPTS):
+        try:
+            return dataset.get_release()
+        except (NotFound, StopIteration):
+            # NotFound is raised if the dataset has no releases at all, StopIteration
+            # if there are releases, but none of them is marked as latest and available.
+            if attempt == RELEASE_ATTEMPTS - 1:
+                raise
+            timer = 2**attempt
+            sly.logger.info(
+                f"Release of dataset {dataset.name} is not ready yet, "
+                f"will check again in {timer} seconds..."
+            )
+            if g.STATE.cancel_event.wait(timeout=timer):
+                # The stop button was pressed while waiting, no need to wait anymore.
+                raise
+
+
+def pull_release(dataset: RemoteDatasetV2, release: Release) -> int:
+    """Downloads annotations and files of the release.
+    Darwin SDK only prepares download functions for the files (blocking=False),
+    they are executed in the thread pool here. Blocking pull of Darwin SDK uses
+    multiprocessing and rich live display, which can't be used from several threads.
+
+    :param dataset: dataset from V7
+    :type dataset: RemoteDatasetV2
+    :param release: release of the dataset to download
+    :type release: Release
+    :return: number of files which were not downloaded (failed or cancelled)
+    :rtype: int
+    """
+    progress, count = dataset.pull(release=release, blocking=False, use_folders=True)
+    if progress is None:
+        sly.logger.info(f"No files to download for dataset {dataset.name}.")
+        return 0
+
+    sly.logger.info(f"Will download {count} files of dataset {dataset.name}.")
+    downloaded = 0
+    with ThreadPoolExecutor(max_workers=g.STATE.max_file_downloads) as executor:
+        futures = [executor.submit(download) for download in progress()]
+        for future in as_completed(futures):
+            if g.STATE.cancel_event.is_set():
+                # The stop button was pressed, files which are not started yet are skipped
+                # and only the files which are downloading right now are waited for.
+                for pending_future in futures:
+                    pending_future.cancel()
+                sly.logger.info(f"Download of dataset {dataset.name} is cancelled.")
+                break
+            try:
+                future.result()
+                downloaded += 1
+            except Exception as e:
+                sly.logger.warning(f"Can not download file of {dataset.name}: {e}")
+
+    failed = count - downloaded
+    if failed:
+        sly.logger.warning(f"{failed} of {count} files of {dataset.name} failed.")
+    return failed
+
+
+def is_not_empty_dir(path: str) -> bool:
+    """Checks if the directory exists and contains anything with a single syscall.
+
+    :param path: path to the directory
+    :type path: str
+    :return: True if the directory exists and is not empty, False otherwise
+    :rtype: bool
+    """
+    try:
+        with os.scandir(path) as entries:
+            return any(True for _ in entries)
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+
+
+def is_downloaded(dataset: RemoteDatasetV2, export_path: str) -> bool:
+    """Checks if the dataset was fully downloaded before and can be reused.
+    The download is reused only if it was made from the latest release of the dataset.
+
+    :param dataset: dataset from V7
+    :type dataset: RemoteDatasetV2
+    :param export_path: path to the downloaded dataset, see get_export_path()
+    :type export_path: str
+    :return: True if the latest release of the dataset was downloaded, False otherwise
+    :rtype: bool
+    """
+    marker_path = os.path.join(export_path, COMPLETE_MARKER)
+    if not os.path.isfile(marker_path):
+        return False
+
+    try:
+        downloaded_release = sly.json.load_json_file(marker_path).get("release")
+        latest_release = dataset.get_release().name
+    except Exception as e:
+        sly.logger.warning(f"Can not check the release of {dataset.name}: {e}")
+        return False
+
+    if downloaded_release != latest_release:
+        sly.logger.info(
+            f"Downloaded release {downloaded_release} of dataset {dataset.name} "
+            f"differs from the latest release {latest_release}, will download it again."
+        )
+        return False
+    return True
 
 
 def get_export_name():
-    timestamp = datetime.now().strftime("%Y-%m-%d")
-    return f"sly_export_{timestamp}"
+    return EXPORT_NAME
 
 
 def get_export_path(dataset: RemoteDatasetV2) -> str: